@@ -0,0 +1,156 @@
+"""
+Compare add_log ingest throughput of the DRF endpoint and the FastAPI service.
+
+Both are driven in-process (Django test client / httpx ASGI transport) against
+the same freshly migrated throwaway database, so the numbers reflect request
+handling and database work rather than network overhead. From the backend
+directory:
+
+    python benchmarks/ingest.py --logs 2000 --trips 50 --concurrency 32
+    python benchmarks/ingest.py --postgres   # server and credentials from .env
+
+The database is created for the run and dropped afterwards: a temporary SQLite
+file, or with --postgres a <DB_NAME>_ingest_bench database on the .env server
+(the DB_USER needs CREATEDB, as for manage.py test). The .env database itself
+is never written to.
+
+The DRF client sends one request at a time. FastAPI is measured the same way
+(concurrency 1), which compares the work done per request, and again with
+--concurrency requests in flight. SQLite serialises writers, so only Postgres
+can gain from concurrency at all.
+
+Measured with --logs 2000 --trips 50 --concurrency 32 on a single-core machine,
+with Postgres 16 (fsync on) on the same host (three runs each, logs/s):
+
+                drf       fastapi (1)   fastapi (32)
+    postgres    128-146   332-392       230-287
+    sqlite      139-147   257-290       229-253
+
+The speedup is all per-request work (prepared statements, one round trip to
+lock the trip and read its last log): FastAPI one request at a time is already
+2-2.7x DRF. With one core the database, the client and the app share the CPU,
+so 32 requests in flight only add scheduling and pool overhead and come out
+slower; concurrency needs spare cores or a database on another host to help.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def configure_django(args):
+    """Set up Django against a throwaway copy of the database, returning (old_name, async_url)"""
+    import django
+    from django.conf import settings
+    from backend import settings as project_settings
+
+    options = {name: getattr(project_settings, name) for name in dir(project_settings) if name.isupper()}
+    options.update(SECRET_KEY=project_settings.SECRET_KEY or 'benchmark', DEBUG=False)
+    if args.postgres:
+        database = dict(project_settings.DATABASES['default'])
+        database['TEST'] = {'NAME': f"{database['NAME']}_ingest_bench"}
+    else:
+        path = os.path.join(tempfile.mkdtemp(), 'bench.sqlite3')
+        database = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': path, 'TEST': {'NAME': path}}
+    options['DATABASES'] = {'default': database}
+    settings.configure(**options)
+    django.setup()
+
+    from django.db import connection
+    from trips.app import postgres_url
+
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    if args.postgres:
+        return old_name, postgres_url(connection.settings_dict)
+    return old_name, f"sqlite+aiosqlite:///{connection.settings_dict['NAME']}"
+
+
+def make_trips(count):
+    from trips.models import Trip
+
+    location = {'lat': 0, 'lng': 0, 'address': 'Benchmark'}
+    return list(Trip.objects.bulk_create(
+        [Trip(current_location=location, pickup_location=location, dropoff_location=location) for _ in range(count)]
+    ))
+
+
+def payloads(trips, logs):
+    """Round-robin logs across trips, each one 15 minutes after the trip's previous log"""
+    statuses = ['DRIVING', 'ON_DUTY', 'DRIVING', 'OFF_DUTY']
+    for i in range(logs):
+        trip = trips[i % len(trips)]
+        step = i // len(trips) + 1
+        yield trip.pk, {
+            'status': statuses[step % len(statuses)],
+            'end_time': (trip.created_at + timedelta(minutes=15 * step)).isoformat(),
+            'location': {'lat': 0, 'lng': 0, 'address': 'Benchmark'},
+            'remarks': '',
+        }
+
+
+def bench_drf(trips, logs):
+    from django.test import Client
+
+    client = Client()
+    started = time.perf_counter()
+    for trip_id, payload in payloads(trips, logs):
+        response = client.post(f'/api/trips/{trip_id}/add_log/', payload, content_type='application/json')
+        assert response.status_code == 201, response.content
+    return time.perf_counter() - started
+
+
+async def bench_fastapi(trips, logs, concurrency, url):
+    import httpx
+    from trips.app import create_app
+
+    app = create_app(url)
+    # Requests for one trip must stay in order, so each worker owns a subset of trips
+    queues = [[] for _ in range(min(concurrency, len(trips)))]
+    for trip_id, payload in payloads(trips, logs):
+        queues[trip_id % len(queues)].append((trip_id, payload))
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+            async def worker(queue):
+                for trip_id, payload in queue:
+                    response = await client.post(f'/api/trips/{trip_id}/add_log/', json=payload)
+                    assert response.status_code == 201, response.text
+
+            started = time.perf_counter()
+            await asyncio.gather(*(worker(queue) for queue in queues))
+            return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--logs', type=int, default=2000)
+    parser.add_argument('--trips', type=int, default=50)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--postgres', action='store_true', help='benchmark against a throwaway database on the .env Postgres server')
+    args = parser.parse_args()
+
+    old_name, url = configure_django(args)
+    from django.db import connection
+
+    try:
+        results = [('drf', bench_drf(make_trips(args.trips), args.logs))]
+        for concurrency in sorted({1, args.concurrency}):
+            seconds = asyncio.run(bench_fastapi(make_trips(args.trips), args.logs, concurrency, url))
+            results.append((f'fastapi ({concurrency})', seconds))
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    print(f'{"endpoint":<16}{"logs":>8}{"seconds":>10}{"logs/s":>10}')
+    for name, seconds in results:
+        print(f'{name:<16}{args.logs:>8}{seconds:>10.2f}{args.logs / seconds:>10.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,156 @@
 from django.contrib import admin
-from .models import Trip, ELDLog
+from django.core.paginator import Paginator
+from django.db import connections, transaction
+from django.db.models import OuterRef, Subquery, Sum
+from django.urls import reverse
+from django.utils.functional import cached_property
+from django.utils.html import format_html
+from .models import Trip, ELDLog, DailyDutyRollup
+from .rollups import rebuild_rollups
+
+
+class EstimatedCountPaginator(Paginator):
+    """Use the Postgres planner's row estimate for unfiltered changelists instead of COUNT(*)"""
+    EXACT_COUNT_BELOW = 100000
+
+    @cached_property
+    def count(self):
+        query = self.object_list.query
+        connection = connections[self.object_list.db]
+        if connection.vendor == 'postgresql' and not query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                    [query.model._meta.db_table],
+                )
+                row = cursor.fetchone()
+            if row and row[0] >= self.EXACT_COUNT_BELOW:
+                return row[0]
+        return super().count
+
+
+def rollup_hours(*statuses):
+    """Correlated subquery summing a trip's rollup seconds for the given statuses"""
+    return Subquery(
+        DailyDutyRollup.objects.filter(trip=OuterRef('pk'), status__in=statuses)
+        .order_by()
+        .values('trip')
+        .annotate(total=Sum('total_seconds'))
+        .values('total')
+    )
+
+
+def hours(seconds):
+    return round((seconds or 0) / 3600, 1)
+
+
+def is_changelist(request):
+    return bool(request.resolver_match and request.resolver_match.url_name.endswith('_changelist'))
+
+
+def lock_trips(trip_ids):
+    """Take the trip row locks add_log holds while appending, in pk order so admins cannot deadlock"""
+    list(Trip.objects.select_for_update().filter(pk__in=trip_ids).order_by('pk').values_list('pk', flat=True))
+
+
+def search_by_id(queryset, search_term, field):
+    """Match a numeric search term exactly, instead of the admin's CAST ... LIKE over every row"""
+    search_term = search_term.strip()
+    if not search_term:
+        return queryset, False
+    if not search_term.isdigit():
+        return queryset.none(), False
+    return queryset.filter(**{field: int(search_term)}), False
+
 
 # Register Trip model
 @admin.register(Trip)
 class TripAdmin(admin.ModelAdmin):
-    list_display = ('id', 'created_at', 'updated_at', 'current_cycle_used')
+    list_display = ('id', 'created_at', 'updated_at', 'current_cycle_used', 'driving_hours', 'on_duty_hours', 'off_duty_hours')
     search_fields = ('id',)
+    search_help_text = 'Search by trip ID'
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if is_changelist(request):
+            # Totals come from the daily rollups, one indexed lookup per row on the page.
+            # Trip.__str__ (used by the action checkboxes) still needs pickup/dropoff.
+            queryset = queryset.defer('current_location').annotate(
+                driving_seconds=rollup_hours('DRIVING'),
+                on_duty_seconds=rollup_hours('DRIVING', 'ON_DUTY'),
+                off_duty_seconds=rollup_hours('OFF_DUTY', 'SLEEPER'),
+            )
+        return queryset
+
+    def get_search_results(self, request, queryset, search_term):
+        return search_by_id(queryset, search_term, 'pk')
+
+    @admin.display(description='Driving hours', ordering='driving_seconds')
+    def driving_hours(self, obj):
+        return hours(obj.driving_seconds)
+
+    @admin.display(description='On-duty hours', ordering='on_duty_seconds')
+    def on_duty_hours(self, obj):
+        return hours(obj.on_duty_seconds)
+
+    @admin.display(description='Off-duty hours', ordering='off_duty_seconds')
+    def off_duty_hours(self, obj):
+        return hours(obj.off_duty_seconds)
 
 # Register ELDLog model
 @admin.register(ELDLog)
 class ELDLogAdmin(admin.ModelAdmin):
-    list_display = ('id', 'trip', 'status', 'start_time', 'end_time')
-    list_filter = ('status',)
-    search_fields = ('trip__id',)
\ No newline at end of file
+    list_display = ('id', 'trip_link', 'status', 'start_time', 'end_time')
+    # A date range filter rather than date_hierarchy: the drilldown links come from
+    # SELECT DISTINCT over truncated start_times, which no index can serve, while these
+    # choices are fixed and filter on start_time ranges that the index covers
+    list_filter = ('status', ('start_time', admin.DateFieldListFilter))
+    search_fields = ('trip__id',)
+    search_help_text = 'Search by trip ID'
+    ordering = ('-start_time', '-id')
+    raw_id_fields = ('trip',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if is_changelist(request):
+            # The changelist only shows these columns, so skip the JSON and text fields
+            queryset = queryset.only('id', 'trip_id', 'status', 'start_time', 'end_time')
+        return queryset
+
+    def get_search_results(self, request, queryset, search_term):
+        # trip_id lives on the log row, so no join to trips_trip is needed
+        return search_by_id(queryset, search_term, 'trip_id')
+
+    @admin.display(description='Trip', ordering='trip_id')
+    def trip_link(self, obj):
+        url = reverse('admin:trips_trip_change', args=[obj.trip_id])
+        return format_html('<a href="{}">Trip #{}</a>', url, obj.trip_id)
+
+    # Logs edited here bypass add_log, so keep the trip's daily rollups in step. The trips
+    # stay locked from the edit until the rebuild commits, so a concurrent add_log either
+    # lands before the rebuild reads the logs or waits and records its log afterwards.
+    def save_model(self, request, obj, form, change):
+        trip_ids = {obj.trip_id, form.initial.get('trip') if change else None} - {None}
+        with transaction.atomic():
+            lock_trips(trip_ids)
+            super().save_model(request, obj, form, change)
+            for trip_id in trip_ids:
+                rebuild_rollups(ELDLog, DailyDutyRollup, trip_id=trip_id)
+
+    def delete_model(self, request, obj):
+        with transaction.atomic():
+            lock_trips([obj.trip_id])
+            super().delete_model(request, obj)
+            rebuild_rollups(ELDLog, DailyDutyRollup, trip_id=obj.trip_id)
+
+    def delete_queryset(self, request, queryset):
+        trip_ids = set(queryset.values_list('trip_id', flat=True))
+        with transaction.atomic():
+            lock_trips(trip_ids)
+            super().delete_queryset(request, queryset)
+            for trip_id in trip_ids:
+                rebuild_rollups(ELDLog, DailyDutyRollup, trip_id=trip_id)
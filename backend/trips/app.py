@@ -1,50 +1,266 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from models import Trip, ELDLog
-from database import get_db
-from schemas.eld_logs import ELDLogCreate, ELDLogResponse
+"""
+Optional FastAPI service for high-volume ELD log ingestion.
+
+It writes to the same tables as the Django app (trips_trip, trips_eldlog,
+trips_dailydutyrollup) and follows the same add_log rules. Both lock the trip
+row before appending, so they can run side by side against one Postgres
+database. Install requirements-ingest.txt, apply the Django migrations, then
+from the backend directory run:
+
+    uvicorn trips.app:app --workers 4
+
+The database is read from INGEST_DATABASE_URL (e.g. sqlite+aiosqlite:///db.sqlite3)
+and defaults to the Postgres settings in .env, using asyncpg. SQLite has no row
+locks and allows one writer at a time, so against SQLite run a single worker
+(drop --workers); requests then queue on that worker's one connection.
+
+Against Postgres each worker keeps up to INGEST_POOL_SIZE connections open
+(default 5) and opens up to INGEST_POOL_MAX_OVERFLOW more under load (default 5),
+so 4 workers use at most 40. Keep workers * (pool size + overflow), plus the
+connections Django itself holds, under the server's max_connections (100 by
+default); requests beyond the pool wait for a free connection.
+"""
+import os
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import Literal
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+
+from dotenv import load_dotenv
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from sqlalchemy import (
+    JSON, BigInteger, Column, Date, DateTime, Float, ForeignKey, Integer, MetaData, String, Table, Text,
+    bindparam, select,
+)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import URL
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from .rollups import split_by_day
+
+load_dotenv()
+
+# Mirrors of the Django-managed tables; the schema itself is owned by Django migrations
+metadata = MetaData()
+JSONColumn = JSON().with_variant(postgresql.JSONB(), 'postgresql')
+
+trips = Table(
+    'trips_trip', metadata,
+    Column('id', BigInteger, primary_key=True),
+    Column('current_location', JSONColumn, nullable=False),
+    Column('created_at', DateTime(timezone=True), nullable=False),
+)
+
+eld_logs = Table(
+    'trips_eldlog', metadata,
+    Column('id', BigInteger, primary_key=True),
+    Column('trip_id', BigInteger, ForeignKey('trips_trip.id'), nullable=False),
+    Column('status', String(10), nullable=False),
+    Column('start_time', DateTime(timezone=True), nullable=False),
+    Column('end_time', DateTime(timezone=True), nullable=False),
+    Column('location', JSONColumn, nullable=False),
+    Column('remarks', Text, nullable=False),
+    Column('created_at', DateTime(timezone=True), nullable=False),
+)
+
+daily_rollups = Table(
+    'trips_dailydutyrollup', metadata,
+    Column('id', BigInteger, primary_key=True),
+    Column('trip_id', BigInteger, ForeignKey('trips_trip.id'), nullable=False),
+    Column('day', Date, nullable=False),
+    Column('status', String(10), nullable=False),
+    Column('total_seconds', Float, nullable=False),
+    Column('log_count', Integer, nullable=False),
+)
+
+
+class ELDLogCreate(BaseModel):
+    status: Literal['ON_DUTY', 'DRIVING', 'OFF_DUTY', 'SLEEPER']
+    end_time: datetime
+    location: dict
+    remarks: str = ''
+
+
+class ELDLogResponse(BaseModel):
+    id: int
+    status: str
+    start_time: datetime
+    end_time: datetime
+    remarks: str
+    location: dict
+    created_at: datetime
+
+
+def postgres_url(settings_dict):
+    """asyncpg URL for a Django Postgres settings dict; a HOST starting with / is a socket directory"""
+    host = settings_dict['HOST'] or None
+    socket = host and host.startswith('/')
+    return URL.create(
+        'postgresql+asyncpg',
+        username=settings_dict['USER'] or None,
+        password=settings_dict['PASSWORD'] or None,
+        host=None if socket else host,
+        port=int(settings_dict['PORT']) if settings_dict['PORT'] else None,
+        database=settings_dict['NAME'],
+        query={'host': host} if socket else {},
+    ).render_as_string(hide_password=False)
+
+
+def database_url():
+    if os.getenv('INGEST_DATABASE_URL'):
+        return os.getenv('INGEST_DATABASE_URL')
+    return postgres_url({
+        name: os.getenv(f'DB_{name}') for name in ('NAME', 'USER', 'PASSWORD', 'HOST', 'PORT')
+    })
+
+
+def as_utc(value):
+    """SQLite hands back naive datetimes; Django stores those as UTC"""
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+async def get_session(request: Request):
+    async with request.app.state.sessionmaker() as session:
+        yield session
+
+
+# Statements are built once and executed with bound parameters, which keeps SQLAlchemy's
+# per-request work down to a cache lookup
+
+# Lock the trip so concurrent appends to the same trip chain one after another,
+# fetching the end of its most recent log in the same round trip
+LOCK_TRIP = (
+    select(
+        trips.c.id,
+        trips.c.created_at,
+        trips.c.current_location,
+        select(eld_logs.c.end_time)
+        .where(eld_logs.c.trip_id == trips.c.id)
+        .order_by(eld_logs.c.end_time.desc())
+        .limit(1)
+        .scalar_subquery()
+        .label('last_end_time'),
+    )
+    .where(trips.c.id == bindparam('trip_id'))
+    .with_for_update(of=trips)
+)
+
+INSERT_LOG = eld_logs.insert().returning(eld_logs.c.id)
+
+
+def upsert_rollup(dialect):
+    """Same upsert as trips.rollups.record_log, expressed as INSERT ... ON CONFLICT"""
+    statement = dialect.insert(daily_rollups)
+    return statement.on_conflict_do_update(
+        index_elements=['trip_id', 'day', 'status'],
+        set_={
+            'total_seconds': daily_rollups.c.total_seconds + statement.excluded.total_seconds,
+            'log_count': daily_rollups.c.log_count + statement.excluded.log_count,
+        },
+    )
+
+
+UPSERT_ROLLUP = {'postgresql': upsert_rollup(postgresql), 'sqlite': upsert_rollup(sqlite)}
+
+
+async def insert_log(session, trip_id, status, start_time, end_time, location, remarks):
+    values = {
+        'trip_id': trip_id,
+        'status': status,
+        'start_time': start_time,
+        'end_time': end_time,
+        'location': location,
+        'remarks': remarks,
+        'created_at': datetime.now(timezone.utc),
+    }
+    result = await session.execute(INSERT_LOG, values)
+    rollups = [
+        {'trip_id': trip_id, 'day': day, 'status': status, 'total_seconds': seconds, 'log_count': 1}
+        for day, seconds in split_by_day(start_time, end_time)
+    ]
+    if rollups:
+        await session.execute(UPSERT_ROLLUP[session.bind.dialect.name], rollups)
+    return {'id': result.scalar_one(), **values}
+
 
 router = APIRouter()
 
-@router.post("/{trip_id}/add_log/", response_model=ELDLogResponse)
-async def add_log(trip_id: int, log: ELDLogCreate, db: Session = Depends(get_db)):
-    try:
-        # Get the trip to check if it exists and get its creation time
-        trip = db.query(Trip).filter(Trip.id == trip_id).first()
-        if not trip:
-            raise HTTPException(status_code=404, detail="Trip not found")
-
-        # Get the most recent log for this trip
-        last_log = (
-            db.query(ELDLog)
-            .filter(ELDLog.trip_id == trip_id)
-            .order_by(ELDLog.end_time.desc())
-            .first()
-        )
+# :int keeps non-numeric IDs from matching, so they 404 as with Django's <int:pk>
+@router.post('/{trip_id:int}/add_log/', response_model=ELDLogResponse, status_code=201)
+async def add_log(trip_id: int, log: ELDLogCreate, session: AsyncSession = Depends(get_session)):
+    async with session.begin():
+        trip = (await session.execute(LOCK_TRIP, {'trip_id': trip_id})).first()
+        if trip is None:
+            raise HTTPException(status_code=404, detail='No Trip matches the given query.')
+        last_end_time = trip.last_end_time
 
-        # Set start_time based on whether this is the first log or not
-        if last_log is None:
-            # If this is the first log, use the trip's creation time
-            start_time = trip.created_at
+        end_time = as_utc(log.end_time)
+        if last_end_time is not None:
+            last_end_time = as_utc(last_end_time)
+            if end_time < last_end_time:
+                return JSONResponse(
+                    {'end_time': ['New log end time must be after the last log end time , which is ' + str(last_end_time.strftime("%Y-%m-%d %H:%M:%S"))]},
+                    status_code=400,
+                )
+            start_time = last_end_time
         else:
-            # If there are previous logs, use the end_time of the last log
-            start_time = last_log.end_time
-
-        # Create the new log entry
-        db_log = ELDLog(
-            trip_id=trip_id,
-            status=log.status,
-            start_time=start_time,
-            end_time=log.end_time,
-            remarks=log.remarks,
-            location=log.location,
+            # First log: record the time before the trip as off duty, as the Django endpoint does
+            created_at = as_utc(trip.created_at)
+            await insert_log(
+                session, trip_id, 'OFF_DUTY',
+                start_time=created_at.replace(hour=0, minute=0, second=0, microsecond=0),
+                end_time=created_at,
+                location=trip.current_location,
+                remarks='Trip started',
+            )
+            start_time = created_at
+
+        return await insert_log(
+            session, trip_id, log.status, start_time, end_time, log.location, log.remarks,
         )
 
-        db.add(db_log)
-        db.commit()
-        db.refresh(db_log)
 
-        return db_log
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+async def validation_error(request, exc):
+    """Report body errors as {field: [messages]} with a 400, like DRF"""
+    errors = {}
+    for error in exc.errors():
+        if error['type'] == 'json_invalid':
+            # DRF's parser reports undecodable bodies as a ParseError
+            return JSONResponse({'detail': f"JSON parse error - {error['ctx']['error']}"}, status_code=400)
+        loc = error['loc']
+        field = loc[1] if len(loc) > 1 and isinstance(loc[1], str) else 'non_field_errors'
+        errors.setdefault(field, []).append(error['msg'])
+    return JSONResponse(errors, status_code=400)
+
+
+def create_app(url=None):
+    @asynccontextmanager
+    async def lifespan(app):
+        engine_url = url or database_url()
+        if engine_url.startswith('sqlite'):
+            # SQLite allows one writer at a time, so queue requests on a single connection
+            pool = {'poolclass': AsyncAdaptedQueuePool, 'pool_size': 1, 'max_overflow': 0}
+        else:
+            pool = {
+                'pool_size': int(os.getenv('INGEST_POOL_SIZE', 5)),
+                'max_overflow': int(os.getenv('INGEST_POOL_MAX_OVERFLOW', 5)),
+            }
+        engine = create_async_engine(engine_url, pool_recycle=1800, **pool)
+        app.state.sessionmaker = async_sessionmaker(engine, expire_on_commit=False)
+        yield
+        await engine.dispose()
+
+    app = FastAPI(title='ELD log ingestion', lifespan=lifespan)
+    app.add_exception_handler(RequestValidationError, validation_error)
+    app.include_router(router, prefix='/api/trips')
+    return app
+
+
+app = create_app()
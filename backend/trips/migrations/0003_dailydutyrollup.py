@@ -0,0 +1,67 @@
+# Generated by Django 5.1.7 on 2026-10-19 19:36
+
+import django.db.models.deletion
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+# Frozen copy of the rollup logic in trips.rollups as of this migration
+def backfill_rollups(apps, schema_editor):
+    ELDLog = apps.get_model('trips', 'ELDLog')
+    DailyDutyRollup = apps.get_model('trips', 'DailyDutyRollup')
+
+    totals = defaultdict(lambda: [0.0, 0])
+    logs = ELDLog.objects.only('trip_id', 'status', 'start_time', 'end_time').iterator(chunk_size=2000)
+    for log in logs:
+        start = timezone.localtime(log.start_time) if timezone.is_aware(log.start_time) else log.start_time
+        end = timezone.localtime(log.end_time) if timezone.is_aware(log.end_time) else log.end_time
+        while start < end:
+            next_midnight = datetime.combine(start.date() + timedelta(days=1), time.min, tzinfo=start.tzinfo)
+            chunk_end = min(end, next_midnight)
+            entry = totals[(log.trip_id, start.date(), log.status)]
+            entry[0] += (chunk_end - start).total_seconds()
+            entry[1] += 1
+            start = chunk_end
+
+    DailyDutyRollup.objects.bulk_create(
+        [
+            DailyDutyRollup(trip_id=trip, day=day, status=status, total_seconds=seconds, log_count=count)
+            for (trip, day, status), (seconds, count) in totals.items()
+        ],
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trips', '0002_eldlog_remarks'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='trip',
+            name='current_cycle_used',
+            field=models.FloatField(default=0),
+        ),
+        migrations.CreateModel(
+            name='DailyDutyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('status', models.CharField(choices=[('ON_DUTY', 'On Duty (Not Driving)'), ('DRIVING', 'Driving'), ('OFF_DUTY', 'Off Duty'), ('SLEEPER', 'Sleeper Berth')], max_length=10)),
+                ('total_seconds', models.FloatField(default=0)),
+                ('log_count', models.PositiveIntegerField(default=0)),
+                ('trip', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='trips.trip')),
+            ],
+            options={
+                'ordering': ['day', 'status'],
+                'indexes': [models.Index(fields=['day', 'status'], name='rollup_day_status_idx')],
+                'constraints': [models.UniqueConstraint(fields=('trip', 'day', 'status'), name='unique_trip_day_status_rollup')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
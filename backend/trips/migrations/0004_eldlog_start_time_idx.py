@@ -0,0 +1,17 @@
+# Generated by Django 5.1.7 on 2026-10-19 19:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trips', '0003_dailydutyrollup'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='eldlog',
+            index=models.Index(fields=['start_time', 'id'], name='eldlog_start_time_idx'),
+        ),
+    ]
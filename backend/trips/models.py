@@ -91,6 +91,10 @@ class ELDLog(models.Model):
 
     class Meta:
         ordering = ['start_time']
+        indexes = [
+            # Serves the admin's start_time range filter and its start_time/id ordering
+            models.Index(fields=['start_time', 'id'], name='eldlog_start_time_idx'),
+        ]
 
     def clean(self):
         """Validate the log entry"""
@@ -99,3 +103,27 @@ class ELDLog(models.Model):
 
     def __str__(self):
         return f"{self.status} from {self.start_time} to {self.end_time}"
+
+class DailyDutyRollup(models.Model):
+    """Per-trip, per-day, per-status duty totals maintained alongside ELDLog"""
+    trip = models.ForeignKey(Trip, on_delete=models.CASCADE, related_name='daily_rollups')
+    day = models.DateField()
+    status = models.CharField(max_length=10, choices=ELDLog.DUTY_STATUS_CHOICES)
+    total_seconds = models.FloatField(default=0)
+    log_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['day', 'status']
+        constraints = [
+            models.UniqueConstraint(fields=['trip', 'day', 'status'], name='unique_trip_day_status_rollup'),
+        ]
+        indexes = [
+            models.Index(fields=['day', 'status'], name='rollup_day_status_idx'),
+        ]
+
+    @property
+    def hours(self):
+        return round(self.total_seconds / 3600, 1)
+
+    def __str__(self):
+        return f"Trip {self.trip_id} {self.status} on {self.day}: {self.hours} hrs"
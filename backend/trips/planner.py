@@ -0,0 +1,282 @@
+from datetime import timedelta
+import numpy as np
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+from .models import Trip
+
+# FMCSA limits not already on Trip (property-carrying driver, 70 hour / 8 day cycle)
+BREAK_AFTER_DRIVING_HOURS = 8
+BREAK_HOURS = 0.5
+CYCLE_HOURS = 70
+RESTART_HOURS = 34
+FUEL_INTERVAL_MILES = 1000
+FUEL_STOP_HOURS = 0.5
+PICKUP_HOURS = 1
+DROPOFF_HOURS = 1
+
+EPSILON = 1e-6
+MAX_STEPS = 10000
+
+DRIVE, DUTY = 0, 1
+RESTART, REST, BREAK, FUEL, DRIVING, WORK = range(6)
+
+# status, remarks and stop type recorded for each simulated action
+ACTIONS = {
+    RESTART: ('OFF_DUTY', '34-hour restart', 'restart'),
+    REST: ('SLEEPER', '10-hour rest', 'rest'),
+    BREAK: ('OFF_DUTY', '30-minute break', 'break'),
+    FUEL: ('ON_DUTY', 'Fuel stop', 'fuel'),
+    DRIVING: ('DRIVING', '', None),
+}
+
+
+def hours_between(start, end):
+    return (end - start).total_seconds() / 3600
+
+
+def duty_state(trip, logs):
+    """Replay a trip's logs into its HOS clocks as of the end of the last log"""
+    state = {
+        'as_of': trip.created_at,
+        'driving': 0.0,
+        'window_start': None,
+        'since_break': 0.0,
+        'non_driving': 0.0,
+        'off_duty': 0.0,
+        'cycle': float(trip.current_cycle_used),
+    }
+    for log in logs:
+        hours = hours_between(log.start_time, log.end_time)
+        if log.status in ['OFF_DUTY', 'SLEEPER']:
+            state['off_duty'] += hours
+            state['non_driving'] += hours
+            if state['off_duty'] >= Trip.REQUIRED_OFF_DUTY_HOURS:
+                state.update(driving=0.0, window_start=None, since_break=0.0)
+            if state['off_duty'] >= RESTART_HOURS:
+                state['cycle'] = 0.0
+        else:
+            state['off_duty'] = 0.0
+            state['cycle'] += hours
+            if state['window_start'] is None:
+                state['window_start'] = log.start_time
+            if log.status == 'DRIVING':
+                state['non_driving'] = 0.0
+                state['driving'] += hours
+                state['since_break'] += hours
+            else:
+                state['non_driving'] += hours
+        if state['non_driving'] >= BREAK_HOURS:
+            state['since_break'] = 0.0
+        state['as_of'] = max(state['as_of'], log.end_time)
+    return state
+
+
+def build_tasks(to_pickup, to_dropoff):
+    """Flatten the route into (kind, amount, speed, label) rows: miles for DRIVE, hours for DUTY"""
+    tasks = [(DRIVE, s['distance_miles'], s['speed_mph'], '') for s in to_pickup]
+    tasks.append((DUTY, PICKUP_HOURS, 1, 'Pickup'))
+    tasks += [(DRIVE, s['distance_miles'], s['speed_mph'], '') for s in to_dropoff]
+    tasks.append((DUTY, DROPOFF_HOURS, 1, 'Dropoff'))
+    return tasks
+
+
+def initial_clocks(state, departures):
+    """HOS clocks at each departure, counting the wait since state['as_of'] as off duty"""
+    wait = np.array([hours_between(state['as_of'], d) for d in departures])
+    off_duty = state['off_duty'] + wait
+    rested = off_duty >= Trip.REQUIRED_OFF_DUTY_HOURS
+    if state['window_start'] is None:
+        window = np.zeros_like(wait)
+    else:
+        window = np.where(rested, 0.0, hours_between(state['window_start'], state['as_of']) + wait)
+    since_break = np.where(
+        rested | (state['non_driving'] + wait >= BREAK_HOURS), 0.0, state['since_break']
+    )
+    return {
+        'time': wait,
+        'driving': np.where(rested, 0.0, state['driving']),
+        'window': window,
+        'since_break': since_break,
+        'cycle': np.where(off_duty >= RESTART_HOURS, 0.0, state['cycle']),
+    }
+
+
+def simulate(tasks, clocks, speed_factors=None, start_hour=0.0, record=False):
+    """
+    Step every candidate through the route in lockstep, one duty action per step.
+
+    clocks holds one array entry per candidate departure (see initial_clocks). When
+    speed_factors (24 multipliers, by local hour of day) are given, segment speeds are
+    scaled by the factor for the hour being driven, start_hour being the hour of day of
+    the reference time. Returns the arrival times in hours after the reference time and,
+    when record is set, a list of (action, label, start, end, mile) events per candidate.
+    """
+    kinds = np.array([t[0] for t in tasks])
+    amounts = np.array([t[1] for t in tasks], dtype=float)
+    speeds = np.array([t[2] for t in tasks], dtype=float)
+
+    t = clocks['time'].astype(float)
+    driving = clocks['driving'].astype(float)
+    window = clocks['window'].astype(float)
+    since_break = clocks['since_break'].astype(float)
+    cycle = clocks['cycle'].astype(float)
+    n = len(t)
+    task = np.zeros(n, dtype=int)
+    remaining = np.full(n, amounts[0])
+    mile = np.zeros(n)
+    since_fuel = np.zeros(n)
+    events = [[] for _ in range(n)] if record else None
+
+    for _ in range(MAX_STEPS):
+        active = task < len(tasks)
+        if not active.any():
+            break
+        current = np.minimum(task, len(tasks) - 1)
+        speed = speeds[current]
+        hour_left = np.inf
+        if speed_factors is not None:
+            clock = (start_hour + t) % 24
+            speed = speed * np.asarray(speed_factors)[clock.astype(int) % 24]
+            hour_left = np.ceil(clock + EPSILON) - clock
+        is_drive = active & (kinds[current] == DRIVE)
+
+        restart = active & (cycle >= CYCLE_HOURS - EPSILON)
+        free = is_drive & ~restart
+        rest = free & (
+            (driving >= Trip.MAX_DRIVING_HOURS - EPSILON) | (window >= Trip.MAX_ON_DUTY_HOURS - EPSILON)
+        )
+        free &= ~rest
+        brk = free & (since_break >= BREAK_AFTER_DRIVING_HOURS - EPSILON)
+        free &= ~brk
+        fuel = free & (since_fuel >= FUEL_INTERVAL_MILES - EPSILON)
+        drive = free & ~fuel
+        work = active & ~is_drive & ~restart
+
+        drive_hours = np.minimum.reduce([
+            remaining / speed,
+            Trip.MAX_DRIVING_HOURS - driving,
+            Trip.MAX_ON_DUTY_HOURS - window,
+            BREAK_AFTER_DRIVING_HOURS - since_break,
+            CYCLE_HOURS - cycle,
+            (FUEL_INTERVAL_MILES - since_fuel) / speed,
+            np.broadcast_to(hour_left, t.shape),
+        ])
+        work_hours = np.minimum(remaining, CYCLE_HOURS - cycle)
+        action = np.select([restart, rest, brk, fuel, drive, work], [RESTART, REST, BREAK, FUEL, DRIVING, WORK], -1)
+        dt = np.select(
+            [restart, rest, brk, fuel, drive, work],
+            [RESTART_HOURS, Trip.REQUIRED_OFF_DUTY_HOURS, BREAK_HOURS, FUEL_STOP_HOURS, drive_hours, work_hours],
+            0.0,
+        )
+        miles = np.where(drive, dt * speed, 0.0)
+
+        if record:
+            for i in np.flatnonzero(active):
+                events[i].append((int(action[i]), tasks[current[i]][3], t[i], t[i] + dt[i], mile[i]))
+
+        on_duty = drive | fuel | work
+        t += dt
+        cycle = np.where(restart, 0.0, cycle + np.where(on_duty, dt, 0.0))
+        window = np.where(restart | rest, 0.0, window + dt)
+        driving = np.where(restart | rest, 0.0, driving + np.where(drive, dt, 0.0))
+        since_break = np.where(
+            restart | rest | brk | ((fuel | work) & (dt >= BREAK_HOURS - EPSILON)),
+            0.0,
+            since_break + np.where(drive, dt, 0.0),
+        )
+        since_fuel = np.where(fuel, 0.0, since_fuel + miles)
+        mile += miles
+        remaining = np.where(drive, remaining - miles, np.where(work, remaining - dt, remaining))
+
+        done = (drive | work) & (remaining <= EPSILON)
+        task = np.where(done, task + 1, task)
+        remaining = np.where(done, amounts[np.minimum(task, len(tasks) - 1)], remaining)
+    else:
+        raise ValidationError("Route could not be planned within the step limit")
+
+    return t, events
+
+
+def projected_logs(trip, state, departure, events, first_log=False):
+    """
+    Turn one candidate's simulated events into the ELDLog rows add_log would record,
+    including the OFF_DUTY 'Trip started' entry it adds before a trip's first log
+    """
+    def at(hours):
+        return state['as_of'] + timedelta(hours=float(hours))
+
+    def location(label, mile):
+        if label == 'Pickup':
+            return trip.pickup_location
+        if label == 'Dropoff':
+            return trip.dropoff_location
+        if mile == 0:
+            return trip.current_location
+        return {'address': f'Mile {mile:.0f} en route', 'mile': round(float(mile), 1)}
+
+    logs, stops = [], []
+    if first_log:
+        logs.append({
+            'status': 'OFF_DUTY',
+            'start_time': trip.created_at.replace(hour=0, minute=0, second=0, microsecond=0),
+            'end_time': trip.created_at,
+            'remarks': 'Trip started',
+            'location': trip.current_location,
+        })
+    if departure > state['as_of']:
+        logs.append({
+            'status': 'OFF_DUTY', 'start_time': state['as_of'], 'end_time': departure,
+            'remarks': 'Waiting to depart', 'location': trip.current_location,
+        })
+    for action, label, start, end, mile in events:
+        if end - start <= EPSILON:
+            continue
+        status, remarks, stop_type = ACTIONS.get(action, ('ON_DUTY', label, label.lower()))
+        if status == 'DRIVING' and logs and logs[-1]['status'] == 'DRIVING':
+            logs[-1]['end_time'] = at(end)
+            continue
+        logs.append({
+            'status': status, 'start_time': at(start), 'end_time': at(end),
+            'remarks': remarks, 'location': location(label, mile),
+        })
+        if stop_type:
+            stops.append({
+                'type': stop_type, 'start_time': at(start), 'end_time': at(end), 'mile': round(float(mile), 1),
+            })
+    return logs, stops
+
+
+def plan_trip(trip, to_pickup, to_dropoff, departures, speed_factors=None):
+    """
+    Plan a trip from its current HOS state over a supplied route.
+
+    Every candidate departure is simulated in one vectorized batch; the earliest arrival
+    wins (ties go to the earlier departure) and is replayed to produce its stops and logs.
+    """
+    logs = list(trip.eld_logs.all())
+    state = duty_state(trip, logs)
+    departures = sorted(departures)
+    if not departures:
+        raise ValidationError("At least one departure time is required")
+    if departures[0] < state['as_of']:
+        raise ValidationError(
+            f"Departure must not be before the end of the last log, which is {state['as_of'].strftime('%Y-%m-%d %H:%M:%S')}"
+        )
+
+    local = timezone.localtime(state['as_of'])
+    start_hour = local.hour + local.minute / 60 + local.second / 3600
+    tasks = build_tasks(to_pickup, to_dropoff)
+    arrivals, _ = simulate(tasks, initial_clocks(state, departures), speed_factors, start_hour)
+    best = int(np.argmin(arrivals))
+    departure = departures[best]
+
+    _, events = simulate(tasks, initial_clocks(state, [departure]), speed_factors, start_hour, record=True)
+    projected, stops = projected_logs(trip, state, departure, events[0], first_log=not logs)
+    return {
+        'departure': departure,
+        'arrival': state['as_of'] + timedelta(hours=float(arrivals[best])),
+        'total_miles': round(sum(t[1] for t in tasks if t[0] == DRIVE), 1),
+        'candidates_evaluated': len(departures),
+        'stops': stops,
+        'eld_logs': projected,
+    }
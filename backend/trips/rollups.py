@@ -0,0 +1,65 @@
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+
+def split_by_day(start_time, end_time):
+    """Yield (day, seconds) for each calendar day covered by [start_time, end_time)"""
+    start = timezone.localtime(start_time) if timezone.is_aware(start_time) else start_time
+    end = timezone.localtime(end_time) if timezone.is_aware(end_time) else end_time
+    while start < end:
+        next_midnight = datetime.combine(start.date() + timedelta(days=1), time.min, tzinfo=start.tzinfo)
+        chunk_end = min(end, next_midnight)
+        yield start.date(), (chunk_end - start).total_seconds()
+        start = chunk_end
+
+
+def rollup_totals(logs):
+    """Aggregate logs into {(trip_id, day, status): [seconds, log_count]}"""
+    totals = defaultdict(lambda: [0.0, 0])
+    for log in logs:
+        for day, seconds in split_by_day(log.start_time, log.end_time):
+            entry = totals[(log.trip_id, day, log.status)]
+            entry[0] += seconds
+            entry[1] += 1
+    return totals
+
+
+def record_log(log):
+    """Fold a newly saved log into its trip's daily rollups"""
+    from .models import DailyDutyRollup
+
+    with transaction.atomic():
+        for (trip_id, day, status), (seconds, count) in rollup_totals([log]).items():
+            updated = DailyDutyRollup.objects.filter(trip_id=trip_id, day=day, status=status).update(
+                total_seconds=F('total_seconds') + seconds,
+                log_count=F('log_count') + count,
+            )
+            if not updated:
+                DailyDutyRollup.objects.create(
+                    trip_id=trip_id, day=day, status=status,
+                    total_seconds=seconds, log_count=count,
+                )
+
+
+def rebuild_rollups(log_model, rollup_model, trip_id=None):
+    """Recompute rollups from scratch, for backfills or after logs are edited outside add_log"""
+    logs = log_model.objects.only('trip_id', 'status', 'start_time', 'end_time')
+    rollups = rollup_model.objects.all()
+    if trip_id is not None:
+        logs = logs.filter(trip_id=trip_id)
+        rollups = rollups.filter(trip_id=trip_id)
+
+    # Read inside the transaction so callers holding the trip lock see every committed log
+    with transaction.atomic():
+        totals = rollup_totals(logs.iterator(chunk_size=2000))
+        rollups.delete()
+        rollup_model.objects.bulk_create(
+            [
+                rollup_model(trip_id=trip, day=day, status=status, total_seconds=seconds, log_count=count)
+                for (trip, day, status), (seconds, count) in totals.items()
+            ],
+            batch_size=2000,
+        )
@@ -1,3 +1,4 @@
+import math
 from rest_framework import serializers
 from .models import Trip, ELDLog
 
@@ -29,4 +30,41 @@ class TripSerializer(serializers.ModelSerializer):
         return obj.calculate_off_duty_hours() 
     
     def get_cycle_used(self, obj):
-        return obj.calculate_cycle_used()
\ No newline at end of file
+        return obj.calculate_cycle_used()
+
+def validate_finite(value):
+    # float() accepts 'nan' and 'inf', which slip past min_value/max_value comparisons
+    if not math.isfinite(value):
+        raise serializers.ValidationError('A finite number is required.')
+
+class RouteSegmentSerializer(serializers.Serializer):
+    distance_miles = serializers.FloatField(min_value=0, max_value=5000, validators=[validate_finite])
+    speed_mph = serializers.FloatField(min_value=1, max_value=100, validators=[validate_finite])
+
+class TripPlanSerializer(serializers.Serializer):
+    MAX_CANDIDATES = 5000
+
+    to_pickup = RouteSegmentSerializer(many=True)
+    to_dropoff = RouteSegmentSerializer(many=True, allow_empty=False)
+    departure_times = serializers.ListField(
+        child=serializers.DateTimeField(), required=False, allow_empty=False, max_length=MAX_CANDIDATES
+    )
+    earliest_departure = serializers.DateTimeField(required=False)
+    hourly_speed_factors = serializers.ListField(
+        child=serializers.FloatField(min_value=0.1, max_value=10, validators=[validate_finite]),
+        required=False, min_length=24, max_length=24
+    )
+    search_hours = serializers.FloatField(default=24, min_value=0, validators=[validate_finite])
+    step_minutes = serializers.IntegerField(default=15, min_value=1)
+
+    def validate(self, data):
+        search_fields = [name for name in ('earliest_departure', 'search_hours', 'step_minutes') if name in self.initial_data]
+        if 'departure_times' in data and search_fields:
+            raise serializers.ValidationError(
+                f"departure_times cannot be combined with {', '.join(search_fields)}"
+            )
+        if 'departure_times' not in data and data['search_hours'] * 60 / data['step_minutes'] >= self.MAX_CANDIDATES:
+            raise serializers.ValidationError(
+                f"search_hours and step_minutes give more than {self.MAX_CANDIDATES} candidate departures"
+            )
+        return data
@@ -1,3 +1,429 @@
-from django.test import TestCase
+import asyncio
+from datetime import datetime, timedelta, timezone as dt_timezone
+from importlib import import_module
+from importlib.util import find_spec
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from .models import Trip, ELDLog, DailyDutyRollup
+from .rollups import split_by_day, rebuild_rollups
+from .planner import build_tasks, duty_state, initial_clocks, plan_trip, simulate
 
-# Create your tests here.
+
+def make_trip(created_at=None, **kwargs):
+    location = {'lat': 0, 'lng': 0, 'address': 'Somewhere'}
+    trip = Trip.objects.create(
+        current_location=location,
+        pickup_location=kwargs.pop('pickup_location', location),
+        dropoff_location=kwargs.pop('dropoff_location', location),
+        **kwargs,
+    )
+    if created_at is not None:
+        Trip.objects.filter(pk=trip.pk).update(created_at=created_at)
+        trip.refresh_from_db()
+    return trip
+
+
+class SplitByDayTests(TestCase):
+    def test_splits_interval_at_midnight(self):
+        start = datetime(2025, 3, 1, 22, 0, tzinfo=dt_timezone.utc)
+        end = datetime(2025, 3, 2, 3, 0, tzinfo=dt_timezone.utc)
+        self.assertEqual(
+            list(split_by_day(start, end)),
+            [(start.date(), 2 * 3600), (end.date(), 3 * 3600)],
+        )
+
+
+class DailyRollupTests(APITestCase):
+    def setUp(self):
+        self.created_at = datetime(2025, 3, 1, 8, 0, tzinfo=dt_timezone.utc)
+        self.trip = make_trip(created_at=self.created_at)
+
+    def add_log(self, trip, duty_status, end_time):
+        return self.client.post(
+            reverse('add-log', args=[trip.pk]),
+            {'status': duty_status, 'end_time': end_time.isoformat(), 'location': {'address': 'Road'}},
+            format='json',
+        )
+
+    def test_add_log_updates_rollups(self):
+        self.add_log(self.trip, 'DRIVING', self.created_at + timedelta(hours=10, minutes=30))
+        self.add_log(self.trip, 'OFF_DUTY', self.created_at + timedelta(hours=20))
+
+        rollups = {
+            (r.day.isoformat(), r.status): r.hours for r in DailyDutyRollup.objects.filter(trip=self.trip)
+        }
+        self.assertEqual(rollups, {
+            ('2025-03-01', 'OFF_DUTY'): 8 + 5.5,
+            ('2025-03-01', 'DRIVING'): 10.5,
+            ('2025-03-02', 'OFF_DUTY'): 4.0,
+        })
+
+    def test_rollups_match_rebuild(self):
+        self.add_log(self.trip, 'DRIVING', self.created_at + timedelta(hours=5))
+        self.add_log(self.trip, 'ON_DUTY', self.created_at + timedelta(hours=18))
+        incremental = list(DailyDutyRollup.objects.values_list('day', 'status', 'total_seconds', 'log_count'))
+
+        rebuild_rollups(ELDLog, DailyDutyRollup)
+        rebuilt = list(DailyDutyRollup.objects.values_list('day', 'status', 'total_seconds', 'log_count'))
+        self.assertEqual(incremental, rebuilt)
+
+    def test_daily_hours_endpoint(self):
+        other = make_trip(created_at=self.created_at)
+        self.add_log(self.trip, 'DRIVING', self.created_at + timedelta(hours=4))
+        self.add_log(other, 'DRIVING', self.created_at + timedelta(hours=2))
+
+        response = self.client.get(
+            reverse('analytics-daily-hours'), {'start': '2025-03-01', 'end': '2025-03-01', 'status': 'DRIVING'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [
+            {'day': '2025-03-01', 'status': 'DRIVING', 'hours': 6.0, 'trip_count': 2},
+        ])
+
+    def test_daily_hours_rejects_bad_dates(self):
+        response = self.client.get(reverse('analytics-daily-hours'), {'start': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('start', response.json())
+
+    def test_near_driving_limit_endpoint(self):
+        other = make_trip(created_at=self.created_at)
+        self.add_log(self.trip, 'DRIVING', self.created_at + timedelta(hours=10, minutes=30))
+        self.add_log(other, 'DRIVING', self.created_at + timedelta(hours=3))
+
+        response = self.client.get(reverse('analytics-near-driving-limit'), {'start': '2025-03-01'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [
+            {'trip_id': self.trip.pk, 'day': '2025-03-01', 'driving_hours': 10.5},
+        ])
+
+    def test_near_driving_limit_is_capped(self):
+        trips = [make_trip(created_at=self.created_at) for _ in range(3)]
+        for trip in trips:
+            self.add_log(trip, 'DRIVING', self.created_at + timedelta(hours=10, minutes=30))
+
+        response = self.client.get(reverse('analytics-near-driving-limit'), {'limit': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 2)
+
+        response = self.client.get(reverse('analytics-near-driving-limit'), {'limit': 5000})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('limit', response.json())
+
+    def test_migration_backfill_matches_rebuild(self):
+        self.add_log(self.trip, 'DRIVING', self.created_at + timedelta(hours=5))
+        self.add_log(self.trip, 'SLEEPER', self.created_at + timedelta(hours=26))
+        rebuild_rollups(ELDLog, DailyDutyRollup)
+        rebuilt = list(DailyDutyRollup.objects.values_list('trip_id', 'day', 'status', 'total_seconds', 'log_count'))
+
+        DailyDutyRollup.objects.all().delete()
+        import_module('trips.migrations.0003_dailydutyrollup').backfill_rollups(apps, None)
+        backfilled = list(DailyDutyRollup.objects.values_list('trip_id', 'day', 'status', 'total_seconds', 'log_count'))
+        self.assertEqual(backfilled, rebuilt)
+
+
+def ingest_database_url():
+    """Async SQLAlchemy URL for the database Django's tests run against, or None without the driver"""
+    if not all(find_spec(module) for module in ('fastapi', 'httpx', 'sqlalchemy')):
+        return None
+    settings_dict = connection.settings_dict
+    if connection.vendor == 'sqlite' and find_spec('aiosqlite'):
+        if connection.is_in_memory_db():
+            # Django's shared-cache in-memory test database is reachable through its URI
+            return f"sqlite+aiosqlite:///{settings_dict['NAME']}&uri=true"
+        return f"sqlite+aiosqlite:///{settings_dict['NAME']}"
+    if connection.vendor == 'postgresql' and find_spec('asyncpg'):
+        from .app import postgres_url
+
+        return postgres_url(settings_dict)
+    return None
+
+
+class IngestServiceTests(TransactionTestCase):
+    """The FastAPI service in trips/app.py must follow the same add_log rules as the DRF view"""
+
+    def setUp(self):
+        self.url = ingest_database_url()
+        if self.url is None:
+            self.skipTest('fastapi, httpx, sqlalchemy and an async database driver are required')
+        self.created_at = datetime(2025, 3, 1, 8, 0, tzinfo=dt_timezone.utc)
+        self.trip = make_trip(created_at=self.created_at)
+
+    def payload(self, duty_status, end_time):
+        return {'status': duty_status, 'end_time': end_time.isoformat(), 'location': {'address': 'Road'}}
+
+    def post(self, *requests):
+        """Send (trip_id, payload) pairs to the FastAPI app in order and return the responses"""
+        import httpx
+        from .app import create_app
+
+        async def send():
+            app = create_app(self.url)
+            async with app.router.lifespan_context(app):
+                transport = httpx.ASGITransport(app=app)
+                async with httpx.AsyncClient(transport=transport, base_url='http://ingest') as client:
+                    # A str payload is sent as the raw JSON request body
+                    return [
+                        await client.post(
+                            f'/api/trips/{trip_id}/add_log/',
+                            **({'content': payload, 'headers': {'Content-Type': 'application/json'}}
+                               if isinstance(payload, str) else {'json': payload}),
+                        )
+                        for trip_id, payload in requests
+                    ]
+
+        return asyncio.run(send())
+
+    def log_rows(self, trip):
+        return [
+            (log.status, log.start_time - trip.created_at, log.end_time - trip.created_at, log.remarks)
+            for log in trip.eld_logs.order_by('start_time', 'id')
+        ]
+
+    def test_logs_chain_like_django_add_log(self):
+        ends = [self.created_at + timedelta(hours=4), self.created_at + timedelta(hours=5, minutes=30)]
+        responses = self.post(
+            (self.trip.pk, self.payload('DRIVING', ends[0])),
+            (self.trip.pk, self.payload('ON_DUTY', ends[1])),
+        )
+        self.assertEqual([r.status_code for r in responses], [201, 201])
+        self.assertEqual(
+            datetime.fromisoformat(responses[0].json()['start_time']), self.created_at
+        )
+        self.assertEqual(datetime.fromisoformat(responses[1].json()['start_time']), ends[0])
+
+        # The same requests through the DRF view must record the same logs
+        twin = make_trip(created_at=self.created_at)
+        for duty_status, end_time in [('DRIVING', ends[0]), ('ON_DUTY', ends[1])]:
+            response = self.client.post(
+                reverse('add-log', args=[twin.pk]), self.payload(duty_status, end_time),
+                content_type='application/json',
+            )
+            self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.log_rows(self.trip), self.log_rows(twin))
+        self.assertEqual(self.log_rows(self.trip)[0], ('OFF_DUTY', -timedelta(hours=8), timedelta(0), 'Trip started'))
+
+    def test_rollups_match_rebuild(self):
+        self.post(
+            (self.trip.pk, self.payload('DRIVING', self.created_at + timedelta(hours=10))),
+            (self.trip.pk, self.payload('SLEEPER', self.created_at + timedelta(hours=20))),
+        )
+        incremental = list(DailyDutyRollup.objects.values_list('trip_id', 'day', 'status', 'total_seconds', 'log_count'))
+        rebuild_rollups(ELDLog, DailyDutyRollup)
+        rebuilt = list(DailyDutyRollup.objects.values_list('trip_id', 'day', 'status', 'total_seconds', 'log_count'))
+        self.assertEqual(incremental, rebuilt)
+        self.assertEqual(len(rebuilt), 4)
+
+    def test_rejects_end_time_before_last_log(self):
+        first, earlier = self.post(
+            (self.trip.pk, self.payload('DRIVING', self.created_at + timedelta(hours=4))),
+            (self.trip.pk, self.payload('ON_DUTY', self.created_at + timedelta(hours=2))),
+        )
+        self.assertEqual(earlier.status_code, 400)
+        self.assertEqual(earlier.json(), {
+            'end_time': ['New log end time must be after the last log end time , which is 2025-03-01 12:00:00'],
+        })
+        self.assertEqual(self.trip.eld_logs.count(), 2)
+
+    def test_unknown_trip(self):
+        [response] = self.post((self.trip.pk + 1000, self.payload('DRIVING', self.created_at)))
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {'detail': 'No Trip matches the given query.'})
+
+    def test_validation_errors_use_drf_format(self):
+        [response] = self.post((self.trip.pk, {'status': 'FLYING', 'location': {}}))
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()
+        self.assertEqual(sorted(errors), ['end_time', 'status'])
+        self.assertTrue(all(isinstance(messages, list) and messages for messages in errors.values()))
+        self.assertFalse(self.trip.eld_logs.exists())
+
+    def test_malformed_requests(self):
+        not_json, not_object, bad_id = self.post(
+            (self.trip.pk, '{"status": '),
+            (self.trip.pk, [self.payload('DRIVING', self.created_at)]),
+            ('abc', self.payload('DRIVING', self.created_at)),
+        )
+        self.assertEqual(not_json.status_code, 400)
+        self.assertEqual(list(not_json.json()), ['detail'])
+        self.assertEqual(not_object.status_code, 400)
+        self.assertEqual(list(not_object.json()), ['non_field_errors'])
+        self.assertEqual(bad_id.status_code, 404)
+        self.assertFalse(self.trip.eld_logs.exists())
+
+class PlannerTests(TestCase):
+    def setUp(self):
+        self.created_at = datetime(2025, 3, 1, 8, 0, tzinfo=dt_timezone.utc)
+        self.trip = make_trip(created_at=self.created_at)
+
+    def test_long_haul_needs_break_rest_and_fuel(self):
+        plan = plan_trip(self.trip, [], [{'distance_miles': 1200, 'speed_mph': 60}], [self.created_at])
+
+        self.assertEqual([stop['type'] for stop in plan['stops']], ['pickup', 'break', 'rest', 'fuel', 'dropoff'])
+        self.assertEqual(plan['stops'][3]['mile'], 1000)
+        self.assertEqual(plan['arrival'], self.created_at + timedelta(hours=33))
+        self.assertEqual(plan['eld_logs'][0]['remarks'], 'Trip started')
+
+        # Posting the projection through add_log must record exactly the projected rows
+        for log in plan['eld_logs'][1:]:
+            response = self.client.post(
+                reverse('add-log', args=[self.trip.pk]),
+                {'status': log['status'], 'end_time': log['end_time'].isoformat(),
+                 'location': log['location'], 'remarks': log['remarks']},
+                content_type='application/json',
+            )
+            self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            list(self.trip.eld_logs.values_list('status', 'start_time', 'end_time', 'remarks')),
+            [(log['status'], log['start_time'], log['end_time'], log['remarks']) for log in plan['eld_logs']],
+        )
+
+    def test_departure_avoids_rush_hour(self):
+        factors = [0.25 if 7 <= hour < 19 else 1 for hour in range(24)]
+        departures = [self.created_at + timedelta(hours=h) for h in range(13)]
+        route = [{'distance_miles': 300, 'speed_mph': 60}]
+
+        plan = plan_trip(self.trip, [], route, departures, factors)
+        # Leaving at 10:00 spends exactly 11 hours driving (8 slow, break, 3 fast) and beats
+        # both an 08:00 start, which runs out of hours, and waiting out rush hour entirely
+        self.assertEqual(plan['departure'], self.created_at + timedelta(hours=2))
+        self.assertEqual(plan['arrival'], self.created_at + timedelta(hours=15, minutes=30))
+        self.assertEqual([stop['type'] for stop in plan['stops']], ['pickup', 'break', 'dropoff'])
+
+        # The batch must agree with simulating each departure on its own
+        state = duty_state(self.trip, self.trip.eld_logs.all())
+        tasks = build_tasks([], route)
+        batch, _ = simulate(tasks, initial_clocks(state, departures), factors, 8)
+        single = [simulate(tasks, initial_clocks(state, [d]), factors, 8)[0][0] for d in departures]
+        self.assertEqual(list(batch), single)
+
+    def test_plan_endpoint(self):
+        response = self.client.post(
+            reverse('trip-plan', args=[self.trip.pk]),
+            {'to_pickup': [{'distance_miles': 60, 'speed_mph': 60}], 'to_dropoff': [{'distance_miles': 300, 'speed_mph': 50}],
+             'earliest_departure': self.created_at.isoformat(), 'search_hours': 2},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['candidates_evaluated'], 9)
+        self.assertEqual(
+            [log['status'] for log in data['eld_logs']], ['OFF_DUTY', 'DRIVING', 'ON_DUTY', 'DRIVING', 'ON_DUTY']
+        )
+
+    def test_plan_endpoint_rejects_departure_times_with_search(self):
+        response = self.client.post(
+            reverse('trip-plan', args=[self.trip.pk]),
+            {'to_pickup': [], 'to_dropoff': [{'distance_miles': 100, 'speed_mph': 50}],
+             'departure_times': [self.created_at.isoformat()], 'search_hours': 4},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('non_field_errors', response.json())
+
+    def test_plan_endpoint_rejects_non_finite_numbers(self):
+        route = {'to_pickup': [], 'to_dropoff': [{'distance_miles': 100, 'speed_mph': 50}]}
+        cases = [
+            ({**route, 'search_hours': 'nan'}, 'search_hours'),
+            ({**route, 'to_dropoff': [{'distance_miles': 'inf', 'speed_mph': 50}]}, 'to_dropoff'),
+            ({**route, 'hourly_speed_factors': [1.0] * 23 + ['nan']}, 'hourly_speed_factors'),
+        ]
+        for payload, field in cases:
+            with self.subTest(field=field):
+                response = self.client.post(
+                    reverse('trip-plan', args=[self.trip.pk]), payload, content_type='application/json'
+                )
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(field, response.json())
+
+    def test_plan_endpoint_rejects_departure_before_last_log(self):
+        response = self.client.post(
+            reverse('trip-plan', args=[self.trip.pk]),
+            {'to_pickup': [], 'to_dropoff': [{'distance_miles': 100, 'speed_mph': 50}],
+             'departure_times': [(self.created_at - timedelta(hours=1)).isoformat()]},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class AdminTests(TestCase):
+    def setUp(self):
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password'))
+        self.created_at = datetime(2025, 3, 1, 8, 0, tzinfo=dt_timezone.utc)
+
+    def add_trips(self, count):
+        for _ in range(count):
+            trip = make_trip(created_at=self.created_at)
+            for hour in range(3):
+                log = ELDLog.objects.create(
+                    trip=trip, status='DRIVING', location={},
+                    start_time=self.created_at + timedelta(hours=hour),
+                    end_time=self.created_at + timedelta(hours=hour + 1),
+                )
+            rebuild_rollups(ELDLog, DailyDutyRollup, trip_id=trip.pk)
+        return log
+
+    def count_queries(self, url, params=None):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, params or {})
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        for name, params in [
+            ('admin:trips_eldlog_changelist', None),
+            ('admin:trips_eldlog_changelist', {'q': '1'}),
+            ('admin:trips_eldlog_changelist', {'start_time__gte': '2025-03-01', 'start_time__lt': '2025-03-02'}),
+            ('admin:trips_trip_changelist', None),
+        ]:
+            with self.subTest(name=name, params=params):
+                ELDLog.objects.all().delete()
+                Trip.objects.all().delete()
+                self.add_trips(2)
+                few = self.count_queries(reverse(name), params)
+                self.add_trips(10)
+                self.assertEqual(self.count_queries(reverse(name), params), few)
+
+    def test_log_changelist_has_no_date_drilldown_scan(self):
+        self.add_trips(2)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('admin:trips_eldlog_changelist'))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([q['sql'] for q in context.captured_queries if 'DISTINCT' in q['sql'].upper()])
+
+    def test_trip_changelist_shows_annotated_hours(self):
+        self.add_trips(1)
+        response = self.client.get(reverse('admin:trips_trip_changelist'))
+        self.assertContains(response, '<td class="field-driving_hours">3.0</td>', html=True)
+
+    def test_editing_log_rebuilds_rollups(self):
+        log = self.add_trips(1)
+        response = self.client.post(reverse('admin:trips_eldlog_change', args=[log.pk]), {
+            'trip': log.trip_id, 'status': 'ON_DUTY',
+            'start_time_0': '2025-03-01', 'start_time_1': '10:00:00',
+            'end_time_0': '2025-03-01', 'end_time_1': '11:00:00',
+            'location': '{"address": "Road"}', 'remarks': '',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            dict(DailyDutyRollup.objects.values_list('status', 'total_seconds')),
+            {'DRIVING': 2 * 3600, 'ON_DUTY': 3600},
+        )
+
+    @skipUnlessDBFeature('has_select_for_update')
+    def test_deleting_logs_locks_trips_before_rebuilding(self):
+        log = self.add_trips(1)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(reverse('admin:trips_eldlog_delete', args=[log.pk]), {'post': 'yes'})
+        self.assertEqual(response.status_code, 302)
+        statements = [q['sql'] for q in context.captured_queries]
+        lock = next(i for i, sql in enumerate(statements) if 'FOR UPDATE' in sql and '"trips_trip"' in sql)
+        delete = next(i for i, sql in enumerate(statements) if sql.startswith('DELETE FROM "trips_eldlog"'))
+        rebuild = next(i for i, sql in enumerate(statements) if sql.startswith('DELETE FROM "trips_dailydutyrollup"'))
+        self.assertLess(lock, delete)
+        self.assertLess(delete, rebuild)
+        self.assertEqual(DailyDutyRollup.objects.get().total_seconds, 2 * 3600)
@@ -6,4 +6,7 @@ urlpatterns = [
     path('trips/<int:pk>/', views.trip_detail, name='trip-detail'),
     path('trips/<int:pk>/generate_pdf/', views.generate_pdf, name='generate-pdf'),
     path('trips/<int:trip_id>/add_log/', views.add_log, name='add-log'),
+    path('trips/<int:pk>/plan/', views.plan, name='trip-plan'),
+    path('analytics/daily_hours/', views.daily_hours, name='analytics-daily-hours'),
+    path('analytics/near_driving_limit/', views.near_driving_limit, name='analytics-near-driving-limit'),
 ] 
\ No newline at end of file
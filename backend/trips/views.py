@@ -10,10 +10,16 @@ from reportlab.lib.units import inch
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from io import BytesIO
-from datetime import datetime, time,timezone
-from .models import Trip, ELDLog
-from .serializers import TripSerializer, ELDLogSerializer
+from datetime import datetime, time,timezone, timedelta
+from .models import Trip, ELDLog, DailyDutyRollup
+from .serializers import TripSerializer, ELDLogSerializer, TripPlanSerializer
+from .rollups import record_log
+from .planner import plan_trip
 from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.utils import timezone as django_timezone
+from django.utils.dateparse import parse_date
 
 @api_view(['GET', 'POST'])
 def trip_list(request):
@@ -55,37 +61,42 @@ def add_log(request, trip_id):
     
     if serializer.is_valid():
         try:
-            # Get the most recent log for this trip
-            last_log = trip.eld_logs.order_by('-end_time').first()
-            
-            # Validate that the new log's end_time is after the last log's end_time
-            if last_log and serializer.validated_data['end_time'] < last_log.end_time:
-                return Response(
-                    {'end_time': ['New log end time must be after the last log end time , which is ' + str(last_log.end_time.strftime("%Y-%m-%d %H:%M:%S"))]},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            
-            # Set start_time based on whether this is the first log or not
-            if last_log is None:
-              
-                first_off_duty_log = ELDLog.objects.create(
-                    trip=trip,
-                    status='OFF_DUTY',
-                    end_time=trip.created_at,
-                    location=trip.current_location,
-                    start_time= trip.created_at.replace(hour=0, minute=0, second=0, microsecond=0),
-                    remarks='Trip started'
-                )
-                first_off_duty_log.save()
-                # If this is the first log, use the trip's creation time
-                start_time = trip.created_at
-            else:
-                # If there are previous logs, use the end_time of the last log
-                start_time = last_log.end_time
-            
-            # Save the log with the calculated start_time
-            log = serializer.save(trip=trip, start_time=start_time)
-            
+            with transaction.atomic():
+                # Lock the trip so concurrent logs chain one after another and don't race on its rollups
+                trip = Trip.objects.select_for_update().get(pk=trip.pk)
+
+                # Get the most recent log for this trip
+                last_log = trip.eld_logs.order_by('-end_time').first()
+
+                # Validate that the new log's end_time is after the last log's end_time
+                if last_log and serializer.validated_data['end_time'] < last_log.end_time:
+                    return Response(
+                        {'end_time': ['New log end time must be after the last log end time , which is ' + str(last_log.end_time.strftime("%Y-%m-%d %H:%M:%S"))]},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+
+                # Set start_time based on whether this is the first log or not
+                if last_log is None:
+
+                    first_off_duty_log = ELDLog.objects.create(
+                        trip=trip,
+                        status='OFF_DUTY',
+                        end_time=trip.created_at,
+                        location=trip.current_location,
+                        start_time= trip.created_at.replace(hour=0, minute=0, second=0, microsecond=0),
+                        remarks='Trip started'
+                    )
+                    record_log(first_off_duty_log)
+                    # If this is the first log, use the trip's creation time
+                    start_time = trip.created_at
+                else:
+                    # If there are previous logs, use the end_time of the last log
+                    start_time = last_log.end_time
+
+                # Save the log with the calculated start_time
+                log = serializer.save(trip=trip, start_time=start_time)
+                record_log(log)
+
             # Return the complete log data including start_time
             return Response(ELDLogSerializer(log).data, status=status.HTTP_201_CREATED)
         except ValidationError as e:
@@ -95,6 +106,137 @@ def add_log(request, trip_id):
             )
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+@api_view(['POST'])
+def plan(request, pk):
+    """Plan breaks, rests and fuel stops over a supplied route, picking the earliest compliant arrival"""
+    trip = get_object_or_404(Trip, pk=pk)
+    serializer = TripPlanSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    data = serializer.validated_data
+    departures = data.get('departure_times')
+    if departures is None:
+        last_log = trip.eld_logs.order_by('-end_time').first()
+        earliest = max(
+            data.get('earliest_departure', django_timezone.now()),
+            last_log.end_time if last_log else trip.created_at,
+        )
+        count = int(data['search_hours'] * 60 // data['step_minutes']) + 1
+        departures = [earliest + timedelta(minutes=data['step_minutes'] * i) for i in range(count)]
+
+    try:
+        result = plan_trip(
+            trip, data['to_pickup'], data['to_dropoff'], departures, data.get('hourly_speed_factors')
+        )
+    except ValidationError as e:
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    result['eld_logs'] = ELDLogSerializer(result['eld_logs'], many=True).data
+    return Response(result)
+
+NEAR_LIMIT_DEFAULT_ROWS = 100
+NEAR_LIMIT_MAX_ROWS = 1000
+
+def _parse_day_range(request):
+    """Read ?start=&end= (YYYY-MM-DD) from the query string, returning (start, end, errors)"""
+    errors = {}
+    days = {}
+    for param in ('start', 'end'):
+        value = request.query_params.get(param)
+        if value is None:
+            days[param] = None
+            continue
+        try:
+            days[param] = parse_date(value)
+        except ValueError:
+            days[param] = None
+        if days[param] is None:
+            errors[param] = ['Date must be in YYYY-MM-DD format']
+    if not errors and days['start'] and days['end'] and days['start'] > days['end']:
+        errors['end'] = ['End date must be on or after start date']
+    return days['start'], days['end'], errors
+
+def _rollups_in_range(start, end):
+    rollups = DailyDutyRollup.objects.all()
+    if start:
+        rollups = rollups.filter(day__gte=start)
+    if end:
+        rollups = rollups.filter(day__lte=end)
+    return rollups
+
+@api_view(['GET'])
+def daily_hours(request):
+    """Fleet-wide hours per day and duty status, read from the daily rollups"""
+    start, end, errors = _parse_day_range(request)
+    duty_status = request.query_params.get('status')
+    if duty_status and duty_status not in dict(ELDLog.DUTY_STATUS_CHOICES):
+        errors['status'] = [f'"{duty_status}" is not a valid choice.']
+    if errors:
+        return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+    rollups = _rollups_in_range(start, end)
+    if duty_status:
+        rollups = rollups.filter(status=duty_status)
+    rows = (
+        rollups.values('day', 'status')
+        .annotate(total_seconds=Sum('total_seconds'), trip_count=Count('trip_id'))
+        .order_by('day', 'status')
+    )
+    return Response([
+        {
+            'day': row['day'],
+            'status': row['status'],
+            'hours': round(row['total_seconds'] / 3600, 1),
+            'trip_count': row['trip_count'],
+        }
+        for row in rows
+    ])
+
+@api_view(['GET'])
+def near_driving_limit(request):
+    """
+    Trips whose driving hours on a calendar day are at or above ?threshold= (default 10),
+    most recent first and capped at ?limit= rows.
+
+    This is a calendar-day approximation for spotting heavy days, not an HOS check: the
+    11-hour driving limit applies per duty period, which the daily rollups do not track.
+    A long shift across midnight is split between two days, and two legal shifts on one
+    day are added together.
+    """
+    start, end, errors = _parse_day_range(request)
+    threshold = request.query_params.get('threshold', Trip.MAX_DRIVING_HOURS - 1)
+    try:
+        threshold = float(threshold)
+    except (TypeError, ValueError):
+        errors['threshold'] = ['A valid number is required.']
+    limit = request.query_params.get('limit', NEAR_LIMIT_DEFAULT_ROWS)
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        limit = 0
+    if not 1 <= limit <= NEAR_LIMIT_MAX_ROWS:
+        errors['limit'] = [f'Ensure this value is between 1 and {NEAR_LIMIT_MAX_ROWS}.']
+    if errors:
+        return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+    rows = (
+        _rollups_in_range(start, end)
+        .filter(status='DRIVING', total_seconds__gte=threshold * 3600)
+        .order_by('-day', '-total_seconds')
+        .values('trip_id', 'day', 'total_seconds')[:limit]
+    )
+    return Response([
+        {
+            'trip_id': row['trip_id'],
+            'day': row['day'],
+            'driving_hours': round(row['total_seconds'] / 3600, 1),
+        }
+        for row in rows
+    ])
+
 @api_view(['GET'])
 def generate_pdf(request, pk):
     trip = get_object_or_404(Trip, pk=pk)